@@ -1,5 +1,6 @@
 from contextlib import AbstractContextManager
 from typing import Callable, Optional, Tuple
+from sqlalchemy import or_
 from sqlalchemy.orm import Session, subqueryload
 from sqlalchemy.exc import SQLAlchemyError
 from app.DAL.models import Dog, DogImage, PossibleDogMatch
@@ -162,6 +163,35 @@ class DogWithImagesRepository:
             session.rollback()
             raise e
 
+    def update_dog_is_verified(self, dog_id: int, is_verified: bool) -> bool:
+        """
+        Update the isVerified property of a dog in the database, only if it has a different value.
+
+        Args:
+            dog_id (int): The ID of the dog.
+            is_verified (bool): The new value of the isVerified property.
+
+        Returns:
+            bool: True if the dog was updated, False if it already had the value.
+        """
+        try:
+            with self.session_factory() as session:
+                # UPDATE dogs SET isVerified = :is_verified WHERE id = :dog_id AND (isVerified IS NULL OR isVerified != :is_verified)
+                # A NULL isVerified doesn't compare as different in SQL, it's matched explicitly
+                updated = session.query(Dog).filter(Dog.id == dog_id, or_(Dog.isVerified.is_(None), Dog.isVerified != is_verified)).update({ Dog.isVerified: is_verified }, synchronize_session=False)
+
+                session.commit()
+
+                return updated > 0
+        except SQLAlchemyError as e:
+            logger.exception(f"DB Error while updating dog isVerified: {e}")
+            session.rollback()
+            raise e
+        except Exception as e:
+            logger.exception(f"Error while updating dog isVerified: {e}")
+            session.rollback()
+            raise e
+
     def delete_possible_dog_match(self, id: int) -> None:
         """
         Delete a possible dog match from the database.
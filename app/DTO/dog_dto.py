@@ -1,10 +1,25 @@
 from enum import Enum
 from typing import List, Optional
-from pydantic import BaseModel, field_serializer
+from pydantic import BaseModel
 from datetime import date
 
 from app.viewmodels.data_types import DogAgeGroup, DogSex, DogType
 
+# DogDTO fields stored as properties of the vectordb documents
+VECTORDB_FIELDS = frozenset({
+    "type",
+    "isResolved",
+    "isVerified",
+    "name",
+    "chipNumber",
+    "breed",
+    "color",
+    "size",
+    "sex",
+    "location",
+    "dogFoundOn",
+})
+
 class DogImageDTO(BaseModel):
     id: Optional[int] = None
     base64Image: str
@@ -37,30 +52,11 @@ class DogDTO(BaseModel):
 
     dogFoundOn: Optional[date] = None
 
-    # add field_serializer to convert dogFoundOn to string
-    @field_serializer("dogFoundOn")
-    def dogFoundOn_serializer(self, v: date, _info):
-        return v.isoformat() if v else None
-
     class Config:
         use_enum_values = True
     
     def to_vectordb_json(self):
-        vectordb_json = {
-            "type": self.type,
-            "isResolved": self.isResolved,
-            "isVerified": self.isVerified,
-            "name": self.name,
-            "chipNumber": self.chipNumber,
-            "breed": self.breed,
-            "color": self.color,
-            "size": self.size,
-            "sex": self.sex,
-            "location": self.location,
-            "dogFoundOn": self.dogFoundOn.isoformat() if self.dogFoundOn else None,
-        }
-        
-        return vectordb_json
+        return self.model_dump(include=VECTORDB_FIELDS, mode="json")
 
 class PossibleDogMatchDTO(BaseModel):
     id: Optional[int] = None
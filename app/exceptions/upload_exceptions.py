@@ -0,0 +1,9 @@
+from http import HTTPStatus
+
+from fastapi import HTTPException
+
+
+class UploadTooLargeException(HTTPException):
+    def __init__(self, detail: str):
+        """Returns HTTP 413"""
+        super().__init__(HTTPStatus.REQUEST_ENTITY_TOO_LARGE.value, detail=detail)
@@ -1,5 +1,3 @@
-import datetime
-from typing import Any
 import uuid
 from app.MyLogger import logger
 import time
@@ -30,10 +28,5 @@ def async_timeit(func):
 
     return wrapper
 
-def _json_serializable(value: Any) -> Any:
-    if isinstance(value, datetime.datetime):
-        return value.isoformat()
-    return value
-
 def generate_dog_id():
     return str(uuid.uuid4())
\ No newline at end of file
@@ -0,0 +1,33 @@
+from typing import Any, Callable, Dict, Optional, Type
+from pydantic import BaseModel
+
+def compile_mapper(src_cls: Type[BaseModel], dst_cls: Type[BaseModel], converters: Optional[Dict[str, Callable[[Any], Any]]] = None) -> Callable[[Any], BaseModel]:
+    """
+    Generate a mapper function from src_cls to dst_cls, copying the fields both models have in common.
+    The mapper is generated once as straight-line attribute copies into dst_cls.model_construct,
+    so mapping skips the per-call field introspection and validation of automapper.
+
+    Args:
+        src_cls (Type[BaseModel]): The model mapped from, the source object must have its fields.
+        dst_cls (Type[BaseModel]): The model mapped to, fields not in src_cls get their default value.
+        converters (Dict[str, Callable], optional): Functions applied to the value of specific fields, e.g. to map nested models.
+
+    Returns:
+        Callable[[Any], BaseModel]: A function mapping a src_cls object to a new dst_cls object.
+    """
+    converters = converters or {}
+    fields = [name for name in dst_cls.model_fields if name in src_cls.model_fields]
+
+    namespace = { "_dst_cls": dst_cls }
+    arguments = []
+    for name in fields:
+        if name in converters:
+            namespace[f"_convert_{name}"] = converters[name]
+            arguments.append(f"        {name}=_convert_{name}(src.{name}),")
+        else:
+            arguments.append(f"        {name}=src.{name},")
+
+    source = "def _map(src):\n    return _dst_cls.model_construct(\n" + "\n".join(arguments) + "\n    )\n"
+    exec(compile(source, f"<mapper {src_cls.__name__} -> {dst_cls.__name__}>", "exec"), namespace)
+
+    return namespace["_map"]
@@ -3,9 +3,47 @@ from app.MyLogger import logger
 from app.helpers.helper import timeit
 from cachetools import cached, LRUCache
 from sentence_transformers import SentenceTransformer
+from PIL import Image
+import numpy as np
 import os
+import threading
 from app.model_optimization.features_extractor import FeatureExtractor
-from app.model_optimization.remove_background import process_pil_image, process_pil_image_YOLO
+from app.model_optimization.remove_background import process_pil_image, process_pil_image_YOLO, process_pil_images_YOLO
+
+class CacheStats:
+    """
+    Hit/miss counters of a cache, used for hit-rate logging.
+    """
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return f"CacheStats(hits={self.hits}, misses={self.misses}, hit_rate={self.hit_rate():.2f})"
+
+# Cache of query embeddings keyed by the content hash of the uploaded query image,
+# searching the same photo again skips the segmentation and embedding models.
+# The embeddings are stored as float32 numpy arrays, about 3 KB per entry for the 768 dimensions of DINO
+# (2 KB for the 512 dimensions of CLIP), so the default 4096 entries take about 13 MB
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+query_embedding_cache = LRUCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+query_embedding_cache_stats = CacheStats()
+query_embedding_cache_lock = threading.Lock()
+
+# Cache of document embeddings keyed by the content hash of the stored document image,
+# reindexing or re-adding the same image skips the segmentation and embedding models.
+# Stored as float32 numpy arrays like the query embeddings, the default 4096 entries take about 13 MB
+DOCUMENT_EMBEDDING_CACHE_SIZE = int(os.environ.get("DOCUMENT_EMBEDDING_CACHE_SIZE", 4096))
+document_embedding_cache = LRUCache(maxsize=DOCUMENT_EMBEDDING_CACHE_SIZE)
+document_embedding_cache_stats = CacheStats()
+document_embedding_cache_lock = threading.Lock()
+
+# The models are called from worker threads, the segmentation model is not thread-safe so the inference is serialized
+model_lock = threading.Lock()
 
 @timeit
 def create_embedding_model():
@@ -30,6 +68,10 @@ def create_sentence_transformer_embedding_model():
         
     embedding_model = SentenceTransformer(model_name_or_path=embedding_model_name)
 
+    # Run the model in half precision on the GPU
+    if embedding_model.device.type == "cuda":
+        embedding_model.half()
+
     return embedding_model
 
 @cached(cache=LRUCache(maxsize=8), info=True)
@@ -41,29 +83,114 @@ def create_dino_embedding_model():
     return embedding_model
 
 
+@timeit
+def warm_up_models(embedding_model, image_segmentation_model):
+    """
+    Run the models once on a blank image, so the lazy initialization of the models (e.g. the YOLO predictor setup
+    and the CUDA kernel selection) happens at startup and not on the first query.
+    """
+    logger.info("Warming up the models")
+
+    embed_query(query_image=Image.new("RGB", (224, 224)), embedding_model=embedding_model, image_segmentation_model=image_segmentation_model)
+
 @timeit
 def embed_documents(documents, embedding_model, image_segmentation_model):
-    logger.info(f"Embedding documents {len(documents)} documents: '{documents}'")
+    logger.info("Embedding %d documents", len(documents))
 
     # Remove background from images
     # masked_documents = [process_pil_image(pil_image=document, image_segmentation_model=image_segmentation_model) for document in documents]
-    masked_documents = [process_pil_image_YOLO(pil_image=document, image_segmentation_model=image_segmentation_model) for document in documents]
-    
-    # Embed the documents
-    documents_embedding = embedding_model.encode(masked_documents)
-    logger.info(f"Documents embedding: {documents_embedding} Dimensions: [{len(documents_embedding)},{len(documents_embedding[0])}]")
+    with model_lock:
+        masked_documents = process_pil_images_YOLO(pil_images=documents, image_segmentation_model=image_segmentation_model)
+
+        # Embed all the documents in a single batch
+        documents_embedding = embedding_model.encode(masked_documents, batch_size=len(masked_documents))
+    logger.info("Documents embedding dimensions: [%d,%d]", len(documents_embedding), len(documents_embedding[0]))
 
     return documents_embedding
 
 @timeit
 def embed_query(query_image, embedding_model, image_segmentation_model):
-    logger.info(f"Embedding query: '{query_image}'")
+    logger.info("Embedding query image of size %s", query_image.size)
 
     # masked_query_image = process_pil_image(pil_image=query_image, image_segmentation_model=image_segmentation_model)
-    masked_query_image = process_pil_image_YOLO(pil_image=query_image, image_segmentation_model=image_segmentation_model)
+    with model_lock:
+        masked_query_image = process_pil_image_YOLO(pil_image=query_image, image_segmentation_model=image_segmentation_model)
+
+        # Embed the query
+        query_embedding = embedding_model.encode(masked_query_image)
+    logger.info("Query embedding dimensions: [%d]", len(query_embedding))
+
+    return query_embedding
+
+def embed_query_cached(query_image_hash: str, create_query_image, embedding_model, image_segmentation_model):
+    """
+    Embed a query image, reusing the cached embedding if the same image was already embedded.
+
+    Args:
+        query_image_hash (str): The content hash of the query image, used as the cache key.
+        create_query_image (Callable): Returns the query PIL image, only called on a cache miss.
+        embedding_model: The embedding model.
+        image_segmentation_model: The image segmentation model.
+
+    Returns:
+        The query embedding.
+    """
+    key = query_image_hash
+
+    # The stats are counted under the cache lock so concurrent requests don't lose counts
+    with query_embedding_cache_lock:
+        query_embedding = query_embedding_cache.get(key)
+        if query_embedding is not None:
+            query_embedding_cache_stats.hits += 1
+        else:
+            query_embedding_cache_stats.misses += 1
+
+    if query_embedding is not None:
+        logger.debug("Query embedding cache hit: %s", query_embedding_cache_stats)
+        return query_embedding
+
+    logger.debug("Query embedding cache miss: %s", query_embedding_cache_stats)
+
+    # Store the embedding as a compact float32 array instead of a list of Python floats
+    query_embedding = np.asarray(embed_query(query_image=create_query_image(), embedding_model=embedding_model, image_segmentation_model=image_segmentation_model), dtype=np.float32)
+
+    with query_embedding_cache_lock:
+        query_embedding_cache[key] = query_embedding
+
+    return query_embedding
+
+def embed_documents_cached(document_hashes: list[str], create_documents, embedding_model, image_segmentation_model):
+    """
+    Embed document images, reusing the cached embeddings of the images that were already embedded.
+    Only the images missing from the cache are embedded, in a single batch.
+
+    Args:
+        document_hashes (list[str]): The content hashes of the document images, used as the cache keys.
+        create_documents (Callable): Gets the indexes of the images missing from the cache and returns their PIL images.
+        embedding_model: The embedding model.
+        image_segmentation_model: The image segmentation model.
+
+    Returns:
+        The documents embeddings, in the order of document_hashes.
+    """
+    # The stats are counted under the cache lock so concurrent requests don't lose counts
+    with document_embedding_cache_lock:
+        documents_embedding = [document_embedding_cache.get(key) for key in document_hashes]
+        missing_indexes = [i for i, document_embedding in enumerate(documents_embedding) if document_embedding is None]
+
+        document_embedding_cache_stats.hits += len(document_hashes) - len(missing_indexes)
+        document_embedding_cache_stats.misses += len(missing_indexes)
+
+    logger.debug("Document embedding cache %d hits, %d misses: %s", len(document_hashes) - len(missing_indexes), len(missing_indexes), document_embedding_cache_stats)
+
+    if missing_indexes:
+        # Store the embeddings as compact float32 arrays instead of lists of Python floats,
+        # one array per embedding so an evicted entry doesn't keep the rest of its batch alive
+        missing_embeddings = [np.asarray(document_embedding, dtype=np.float32) for document_embedding in embed_documents(create_documents(missing_indexes), embedding_model=embedding_model, image_segmentation_model=image_segmentation_model)]
+
+        with document_embedding_cache_lock:
+            for i, document_embedding in zip(missing_indexes, missing_embeddings):
+                document_embedding_cache[document_hashes[i]] = document_embedding
+                documents_embedding[i] = document_embedding
 
-    # Embed the query
-    query_embedding = embedding_model.encode(masked_query_image)
-    logger.info(f"Query embedding: {query_embedding} Dimensions: [{len(query_embedding)}]")
-
-    return query_embedding
\ No newline at end of file
+    return documents_embedding
@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from app.init.exception_handler import setup_exacption_handler
 from pydantic_settings import BaseSettings
 
@@ -14,7 +15,7 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-app = FastAPI(openapi_url=settings.openapi_url)
+app = FastAPI(openapi_url=settings.openapi_url, default_response_class=ORJSONResponse)
 
 logger.info("Starting up the app")
 
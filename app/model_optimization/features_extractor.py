@@ -15,9 +15,16 @@ class FeatureExtractor:
             print(f"Error loading model: {e}")
             exit(1)
 
-        self.dino.to(self.device)
+        # Run the model in half precision on the GPU, the features are returned as float32
+        self.dtype = torch.float16 if self.device.type == "cuda" else torch.float32
+
+        self.dino.to(self.device, dtype=self.dtype)
         self.dino.eval()
 
+        # All the inputs have the same fixed shape, let cuDNN pick the fastest kernels for it
+        if self.device.type == "cuda":
+            torch.backends.cudnn.benchmark = True
+
         # Define the image transformations
         self.image_transforms = transforms.Compose(
             [
@@ -29,12 +36,13 @@ class FeatureExtractor:
 
     from typing import Union
 
-    def encode(self, pil_images: Union[Image.Image, List[Image.Image]]):
+    def encode(self, pil_images: Union[Image.Image, List[Image.Image]], batch_size: int = None):
         """
         Extract features from a PIL image or a list of PIL images using the DINO model.
 
         Args:
         pil_images (Union[PIL.Image, List[PIL.Image]]): A PIL image or a list of PIL images.
+        batch_size (int, optional): Max number of images per forward pass. Defaults to all the images in one pass.
 
         Returns:
         List[torch.Tensor]: Extracted feature tensors.
@@ -44,18 +52,29 @@ class FeatureExtractor:
         else:
             pil_images_list = pil_images
 
+        if len(pil_images_list) == 0:
+            return []
+
+        batch_size = batch_size or len(pil_images_list)
+
         features_list = []
-        for pil_image in pil_images_list:
-            image = pil_image.convert("RGB")
-            image_tensor = self.image_transforms(image).unsqueeze(0).to(self.device)
-            with torch.no_grad():
-                features = self.dino(image_tensor).float()
+        for start in range(0, len(pil_images_list), batch_size):
+            # Stack the images into a single (B, C, H, W) batch so the model runs one forward pass per batch
+            images_tensor = torch.stack([self.image_transforms(pil_image.convert("RGB")) for pil_image in pil_images_list[start:start + batch_size]])
+
+            # Copy the batch to the GPU from pinned memory so the transfer doesn't block
+            if self.device.type == "cuda":
+                images_tensor = images_tensor.pin_memory()
+
+            images_tensor = images_tensor.to(self.device, dtype=self.dtype, non_blocking=True)
+            with torch.inference_mode():
+                features = self.dino(images_tensor).float()
 
-            # Free GPU memory if used
-            if self.device.type == 'cuda':
-                torch.cuda.empty_cache()
+            features_list.extend(features.cpu().tolist())
 
-            features_list.append(features[0].tolist())
+        # Free GPU memory if used
+        if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
 
         if isinstance(pil_images, Image.Image):
             return features_list[0]
@@ -104,43 +104,62 @@ def process_pil_image(pil_image, text_prompt="a dog", image_segmentation_model=N
     return masked_im
 
 def process_pil_image_YOLO(pil_image, image_segmentation_model):
-    # Run inference on the image
-    results = image_segmentation_model(pil_image, retina_masks=True, classes=16)  # Class 16 for dogs in COCO
-    for result in results:
-        if result.masks == None:
-            logger.info(f"No dogs detected in the image.")
-            return pil_image
-        
-        masks = result.masks.data  # get array results
-        boxes = result.boxes.data
-        clss = boxes[:, 5]  # extract classes
-        dog_indices = torch.where(clss == 16)  # indices of dog detections
-        dog_masks = masks[dog_indices]  # relevant masks for dogs
-        dog_mask = torch.any(dog_masks, dim=0).int() * 255  # combine masks
-        dog_mask = dog_mask.squeeze().cpu().numpy()
-        
-        image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-        if image.shape[:2] != dog_mask.shape:
-            raise ValueError("The dimensions of the image and the mask must match")
-
-        # Convert dog_mask to uint8 binary mask
-        binary_mask = np.uint8(dog_mask)
-
-        # Apply the mask to keep only the masked area
-        masked_area = cv2.bitwise_and(image, image, mask=binary_mask)
-
-        # Create an inverse mask for the background
-        inverse_mask = cv2.bitwise_not(binary_mask)
-
-        # Create a background image with the specified color
-        background = np.full(image.shape, (0, 0, 0), dtype=np.uint8)
-
-        # Apply the inverse mask to the background image
-        background = cv2.bitwise_and(background, background, mask=inverse_mask)
-
-        # Combine the masked area and the background
-        combined_image = cv2.add(masked_area, background)
-        combined_image = Image.fromarray(cv2.cvtColor(combined_image, cv2.COLOR_BGR2RGB))
-        combined_image = convert_pil_image_to_webp(combined_image)
-        
-        return combined_image
+    return process_pil_images_YOLO([pil_image], image_segmentation_model)[0]
+
+def process_pil_images_YOLO(pil_images, image_segmentation_model):
+    """
+    Mask out everything but the dogs in a list of PIL images, running the segmentation model once on the whole batch.
+
+    Args:
+    pil_images (list of PIL.Image.Image): The PIL images to process.
+    image_segmentation_model: The YOLO segmentation model.
+
+    Returns:
+    list of PIL.Image.Image: The processed PIL images, images without dogs are returned as is.
+    """
+    if len(pil_images) == 0:
+        return []
+
+    # Run inference on all the images at once
+    results = image_segmentation_model(pil_images, retina_masks=True, classes=16)  # Class 16 for dogs in COCO
+
+    return [mask_dog_YOLO(pil_image, result) for pil_image, result in zip(pil_images, results)]
+
+def mask_dog_YOLO(pil_image, result):
+    if result.masks == None:
+        logger.info(f"No dogs detected in the image.")
+        return pil_image
+
+    masks = result.masks.data  # get array results
+    boxes = result.boxes.data
+    clss = boxes[:, 5]  # extract classes
+    dog_indices = torch.where(clss == 16)  # indices of dog detections
+    dog_masks = masks[dog_indices]  # relevant masks for dogs
+    dog_mask = torch.any(dog_masks, dim=0).int() * 255  # combine masks
+    dog_mask = dog_mask.squeeze().cpu().numpy()
+
+    image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+    if image.shape[:2] != dog_mask.shape:
+        raise ValueError("The dimensions of the image and the mask must match")
+
+    # Convert dog_mask to uint8 binary mask
+    binary_mask = np.uint8(dog_mask)
+
+    # Apply the mask to keep only the masked area
+    masked_area = cv2.bitwise_and(image, image, mask=binary_mask)
+
+    # Create an inverse mask for the background
+    inverse_mask = cv2.bitwise_not(binary_mask)
+
+    # Create a background image with the specified color
+    background = np.full(image.shape, (0, 0, 0), dtype=np.uint8)
+
+    # Apply the inverse mask to the background image
+    background = cv2.bitwise_and(background, background, mask=inverse_mask)
+
+    # Combine the masked area and the background
+    combined_image = cv2.add(masked_area, background)
+    combined_image = Image.fromarray(cv2.cvtColor(combined_image, cv2.COLOR_BGR2RGB))
+    combined_image = convert_pil_image_to_webp(combined_image)
+
+    return combined_image
@@ -1,33 +1,35 @@
+from enum import Enum
 from http import HTTPStatus
 
 from app.DTO.dog_dto import DogDTO, DogImageDTO, DogType, PossibleDogMatchDTO
-from app.helpers.image_helper import create_pil_images, get_base64
+from app.helpers.image_helper import create_pil_image, create_pil_images, hash_image
 from app.services.auth import VerifyToken
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional
 from app.MyLogger import logger
 from app.services.dog_service import DogWithImagesService
 from app.services.vectordb_indexer import VectorDBIndexer
 from app.viewmodels.api_response import APIResponse
-from app.viewmodels.dog_viewmodel import RETURN_PROPERTIES, DogFullDetailsResponse, DogImageResponse, DogAddRequest, DogResolvedRequest, DogResponse, DogSearchRequest, PossibleDogMatchRequest, PossibleDogMatchResponse
+from app.viewmodels.dog_viewmodel import IMAGE_RETURN_PROPERTIES, LIST_RETURN_PROPERTIES, DogFullDetailsResponse, DogImageResponse, DogAddRequest, DogResolvedRequest, DogResponse, DogSearchRequest, PossibleDogMatchRequest, PossibleDogMatchResponse
 from fastapi import APIRouter, Query, Security, UploadFile
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from pydantic import BaseModel
-from app.helpers.model_helper import create_embedding_model, embed_query
-from app.helpers.helper import timeit
-from app.helpers.image_helper import resize_and_convert
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from app.helpers.mapper_helper import compile_mapper
+from app.helpers.image_helper import process_uploaded_image
 from app.helpers.weaviate_helper import FilterValueTypes
-from weaviate.util import generate_uuid5
-from app.models.predicates import Predicate, Filter, and_, or_
+from app.models.predicates import Predicate, and_, or_
 # from sentence_transformers import SentenceTransformer
+import asyncio
+import pybase64
+import orjson
 import os
+from concurrent.futures import ThreadPoolExecutor
 from app.services.ivectordb_client import IVectorDBClient
-from app.services.weaviate_vectordb_client import WeaviateVectorDBClient
-from automapper import mapper
 from app.DAL.database import Database, get_connection_string
 from app.DAL.repositories import DogWithImagesRepository
+from app.exceptions.upload_exceptions import UploadTooLargeException
 # from lang_sam import LangSAM
-from ultralytics import YOLO
+# The model and vectordb client modules (torch, ultralytics, sentence_transformers, weaviate) are heavy to import,
+# they are imported where they are used so importing the router stays cheap
 
 logger.info("Starting up the dogfinder router")
 
@@ -39,14 +41,79 @@ embedding_model: Any = None
 image_segmentation_model: Any = None
 db: Database = None
 
+# Thread pool for the CPU-bound image decoding, resizing and encoding of uploaded images
+IMG_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="dogfinder-img")
+
+# Maximum size of an uploaded image, larger images are rejected before they are read or decoded
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+
+# Mappers from the DTOs to the response models, generated once at import
+IMAGE_TO_RESPONSE = compile_mapper(DogImageDTO, DogImageResponse)
+DOG_TO_RESPONSE = compile_mapper(DogDTO, DogResponse, { "images": lambda images: [IMAGE_TO_RESPONSE(image) for image in images] })
+DOG_TO_FULL_DETAILS_RESPONSE = compile_mapper(DogDTO, DogFullDetailsResponse, { "images": lambda images: [IMAGE_TO_RESPONSE(image) for image in images] })
+POSSIBLE_DOG_MATCH_TO_RESPONSE = compile_mapper(PossibleDogMatchDTO, PossibleDogMatchResponse, {
+    "dog": lambda dog: DOG_TO_RESPONSE(dog) if dog is not None else None,
+    "possibleMatch": lambda dog: DOG_TO_RESPONSE(dog) if dog is not None else None
+})
+POSSIBLE_DOG_MATCH_REQUEST_TO_DTO = compile_mapper(PossibleDogMatchRequest, PossibleDogMatchDTO)
+
+# Serializer for responses carrying pydantic models in their data, built once at import.
+# Serializes straight to JSON bytes in pydantic-core instead of model_dump/jsonable_encoder followed by json.dumps
+API_RESPONSE_ADAPTER = TypeAdapter(APIResponse)
+
 CERTAINTY = os.environ.get("CERTAINTY", 0.6355)
 logger.info(f"CERTAINTY: {CERTAINTY}")
 
 # CHANGE THIS TO FALSE ON PRODUCTION
 IS_VERIFIED_FIELD_DEFAULT_VALUE = False
 
+# Fields copied as is from DogAddRequest to DogDTO in add_document
+DOG_ADD_REQUEST_TO_DTO_FIELDS = tuple(field for field in DogAddRequest.model_fields if field in DogDTO.model_fields and field not in ("images", "reporterId", "isVerified"))
+
+# HNSW index parameters, the defaults are the ones of Weaviate.
+# distance, efConstruction and maxConnections can only be set when the class is created
+VECTOR_INDEX_HNSW_CONFIG = {
+    "distance": "cosine",
+    "ef": int(os.environ.get("VECTOR_INDEX_EF", -1)),
+    "efConstruction": int(os.environ.get("VECTOR_INDEX_EF_CONSTRUCTION", 128)),
+    "maxConnections": int(os.environ.get("VECTOR_INDEX_MAX_CONNECTIONS", 64))
+}
+logger.info(f"VECTOR_INDEX_HNSW_CONFIG: {VECTOR_INDEX_HNSW_CONFIG}")
+
+# Compression of the stored vectors in the HNSW index, "none" keeps full precision vectors.
+# "pq" enables product quantization, the codebook is trained on the vectors already in the index.
+# The class is always created without quantization, it's enabled on startup once the class holds vectors.
+# "bq" enables binary quantization, the candidates are rescored with the full vectors. On an HNSW index it requires Weaviate 1.24 or later,
+# it is rejected on startup against the version of the connected server (the compose files pin 1.21)
+VECTOR_INDEX_QUANTIZATION = os.environ.get("VECTOR_INDEX_QUANTIZATION", "none").lower()
+VECTOR_INDEX_QUANTIZATION_CONFIGS = {
+    "none": {},
+    "pq": {
+        "pq": {
+            "enabled": True,
+            "trainingLimit": 100000
+        }
+    },
+    "bq": {
+        "bq": {
+            "enabled": True,
+            "rescoreLimit": 200
+        }
+    }
+}
+# Minimum Weaviate version supporting each quantization on an HNSW index, older servers keep full precision vectors
+VECTOR_INDEX_QUANTIZATION_MIN_WEAVIATE_VERSIONS = {
+    "pq": (1, 18, 0),
+    "bq": (1, 24, 0)
+}
+if VECTOR_INDEX_QUANTIZATION not in VECTOR_INDEX_QUANTIZATION_CONFIGS:
+    raise ValueError(f"Invalid VECTOR_INDEX_QUANTIZATION '{VECTOR_INDEX_QUANTIZATION}', allowed values are: {', '.join(VECTOR_INDEX_QUANTIZATION_CONFIGS)}")
+logger.info(f"VECTOR_INDEX_QUANTIZATION: {VECTOR_INDEX_QUANTIZATION}")
+
 dog_class_definition = {
         "class": "Dog",
+        "vectorIndexType": "hnsw",
+        "vectorIndexConfig": dict(VECTOR_INDEX_HNSW_CONFIG),
         "invertedIndexConfig": {
             "indexNullState": True,
             "indexTimestamps": True
@@ -173,10 +240,21 @@ async def startup_event():
     global image_segmentation_model
     global db
 
+    from app.services.weaviate_vectordb_client import WeaviateVectorDBClient
+    from app.helpers.model_helper import create_embedding_model, warm_up_models
+    from ultralytics import YOLO
+
     # Create the vector db client, connecting to the weaviate instance
     vecotrDBClient = WeaviateVectorDBClient(url=f"{os.getenv('WEAVIATE_HOST', 'http://localhost:8080')}")
     # Create the schema
     vecotrDBClient.create_schema(class_name="Dog", class_obj=dog_class_definition)
+    # Enable the quantization of the vector index, only once the class holds the vectors it's trained on
+    if VECTOR_INDEX_QUANTIZATION != "none":
+        vecotrDBClient.update_vector_index_quantization(
+            class_name="Dog",
+            quantization_config=VECTOR_INDEX_QUANTIZATION_CONFIGS[VECTOR_INDEX_QUANTIZATION],
+            min_version=VECTOR_INDEX_QUANTIZATION_MIN_WEAVIATE_VERSIONS[VECTOR_INDEX_QUANTIZATION]
+        )
 
     # DB variables
     DB_USER = os.environ.get("DB_USER")
@@ -196,6 +274,9 @@ async def startup_event():
     # image_segmentation_model = LangSAM(sam_type="vit_b")    
     image_segmentation_model = YOLO("app/model_optimization/yolov8x-seg.pt")  # Load pretrained YOLOv8x model):
 
+    # Run the models once so the first query doesn't pay for their lazy initialization
+    warm_up_models(embedding_model, image_segmentation_model)
+
     # Create vectordb indexer
     vectorDBIndexer = VectorDBIndexer(vecotrDBClient, embedding_model, image_segmentation_model)
 
@@ -210,7 +291,7 @@ auth = VerifyToken()
 # async def query(type: DogType = Form(...), breed: Optional[str] = Form(None), img: UploadFile = File(...), top: int = Form(10), isVerified: Optional[bool] = Form(True)):
 #     try:
 #         # Handle the image, resize it and convert it to base64 with webp format and get the content type
-#         base64Images, imageContentTypes = zip(*handle_uploaded_images([img]))
+#         base64Images, imageContentTypes = zip(*await handle_uploaded_images([img]))
 
 #         # Create QueryRequest
 #         queryRequest = QueryRequest(type=type, breed=breed, imageBase64=base64Images[0], top=top, isVerified=isVerified)
@@ -224,35 +305,39 @@ auth = VerifyToken()
 #         api_response = APIResponse(status_code=500, message=f"Error while querying the vecotrdb: {e}", data={ "total": 0, "results": [] })
 #     finally:
 #         # return back a json response and set the status code to api_response.status_code
-#         return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+#         return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
 @router.post("/search_in_found_dogs", response_model=APIResponse)
 async def search_in_found_dogs(dogSearchRequest: DogSearchRequest):
     try:
         # Handle the image, resize it and convert it to base64 with webp format and get the content type
-        base64Images, imageContentTypes = zip(*handle_uploaded_images([dogSearchRequest.base64Image]))
+        base64Images, imageContentTypes, imageContents, imageHashes = zip(*await handle_uploaded_images([dogSearchRequest.base64Image]))
 
         # Create QueryRequest
         dogSearchRequest.type = DogType.FOUND
         dogSearchRequest.base64Image = base64Images[0]
         dogSearchRequest.isVerified = True
 
-        # Query the database
-        results = query_vector_db(dogSearchRequest)
+        # Query the database, the embedding and the vectordb query run in a worker thread so they don't block the event loop
+        results = await asyncio.to_thread(query_vector_db, dogSearchRequest, imageContents[0], imageHashes[0])
 
-        api_response = APIResponse(status_code=200, message=f"Queried {len(results)} results from the vecotrdb", data={ "total": len(results), "results": results })
+        # The results are plain dicts from the vectordb, the APIResponse body is built directly without a pydantic model
+        content = { "status_code": 200, "message": f"Queried {len(results)} results from the vecotrdb", "data": { "total": len(results), "results": results }, "meta": {} }
+    except UploadTooLargeException as e:
+        logger.warning(f"Rejected search image: {e.detail}")
+        content = APIResponse(status_code=e.status_code, message=e.detail, data={ "total": 0, "results": [] }).to_dict()
     except Exception as e:
         logger.exception(f"Error while querying the vecotrdb: {e}")
-        api_response = APIResponse(status_code=500, message=f"Error while querying the vecotrdb: {e}", data={ "total": 0, "results": [] })
+        content = APIResponse(status_code=500, message=f"Error while querying the vecotrdb: {e}", data={ "total": 0, "results": [] }).to_dict()
     finally:
-        # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        # return back a json response and set the status code to content["status_code"]
+        return ORJSONResponse(content=content, status_code=content["status_code"])
 
 @router.post("/search_in_lost_dogs", response_model=APIResponse)
 async def search_in_lost_dogs(dogSearchRequest: DogSearchRequest):
     try:
         # Handle the image, resize it and convert it to base64 with webp format and get the content type
-        base64Images, imageContentTypes = zip(*handle_uploaded_images([dogSearchRequest.base64Image]))
+        base64Images, imageContentTypes, imageContents, imageHashes = zip(*await handle_uploaded_images([dogSearchRequest.base64Image]))
 
         # Create QueryRequest
         dogSearchRequest.type = DogType.LOST
@@ -260,65 +345,129 @@ async def search_in_lost_dogs(dogSearchRequest: DogSearchRequest):
         dogSearchRequest.isVerified = True
         # queryRequest = QueryRequest(type=DogType.LOST, breed=breed, imageBase64=base64Images[0], top=top, isVerified=True)
 
-        # Query the database
-        results = query_vector_db(dogSearchRequest)
+        # Query the database, the embedding and the vectordb query run in a worker thread so they don't block the event loop
+        results = await asyncio.to_thread(query_vector_db, dogSearchRequest, imageContents[0], imageHashes[0])
 
-        api_response = APIResponse(status_code=200, message=f"Queried {len(results)} results from the vecotrdb", data={ "total": len(results), "results": results })
+        # The results are plain dicts from the vectordb, the APIResponse body is built directly without a pydantic model
+        content = { "status_code": 200, "message": f"Queried {len(results)} results from the vecotrdb", "data": { "total": len(results), "results": results }, "meta": {} }
+    except UploadTooLargeException as e:
+        logger.warning(f"Rejected search image: {e.detail}")
+        content = APIResponse(status_code=e.status_code, message=e.detail, data={ "total": 0, "results": [] }).to_dict()
     except Exception as e:
         logger.exception(f"Error while querying the vecotrdb: {e}")
-        api_response = APIResponse(status_code=500, message=f"Error while querying the vecotrdb: {e}", data={ "total": 0, "results": [] })
+        content = APIResponse(status_code=500, message=f"Error while querying the vecotrdb: {e}", data={ "total": 0, "results": [] }).to_dict()
     finally:
-        # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        # return back a json response and set the status code to content["status_code"]
+        return ORJSONResponse(content=content, status_code=content["status_code"])
 
 @router.get("/get_unverified_documents", response_model=APIResponse)
 async def get_unverified_documents(auth_result: dict = Security(auth.verify, scopes=['read:unverified_documents'])):
     try:
-        # Query the database
-        results = vecotrDBClient.query(class_name="Dog", query=None, query_embedding=None, limit=10000, offset=None, filter=and_(*[Predicate(["isVerified"], "Equal", False, FilterValueTypes.valueBoolean)]).to_dict(), properties=RETURN_PROPERTIES)
+        # Query the first page, so query errors are still returned as a 500 response before streaming starts
+        results = await asyncio.to_thread(query_unverified_documents, 0)
 
-        api_response = APIResponse(status_code=200, message=f"Queried {len(results)} results from the vecotrdb", data={ "total": len(results), "results": results })
+        # Stream the results page by page instead of loading and serializing all of them at once
+        return StreamingResponse(stream_unverified_documents(results), media_type="application/json")
     except Exception as e:
         logger.exception(f"Error while querying the vecotrdb: {e}")
         api_response = APIResponse(status_code=500, message=f"Error while querying the vecotrdb: {e}", data={ "total": 0, "results": [] })
+
+        # return back a json response and set the status code to api_response.status_code
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+
+def query_unverified_documents(offset: int) -> list:
+    return vecotrDBClient.query(class_name="Dog", query_embedding=None, limit=UNVERIFIED_DOCUMENTS_PAGE_SIZE, offset=offset, filter=UNVERIFIED_DOCUMENTS_FILTER, properties=LIST_RETURN_PROPERTIES)
+
+def stream_unverified_documents(results: list):
+    """
+    Stream the unverified documents as the same APIResponse JSON body, querying the vectordb one page at a time.
+    This is a sync generator, StreamingResponse iterates it in the threadpool so the blocking queries don't block the event loop.
+    If a later page fails the 200 status was already sent, the body is still closed but its message is the error
+    and its meta is marked with error and partial.
+
+    Args:
+        results: The first page of results.
+    """
+    total = 0
+    error = None
+
+    yield b'{"status_code":200,"data":{"results":['
+
+    try:
+        while len(results) > 0:
+            for result in results:
+                yield (b"," if total > 0 else b"") + orjson.dumps(result)
+                total += 1
+
+            # The last page was reached
+            if len(results) < UNVERIFIED_DOCUMENTS_PAGE_SIZE or total >= UNVERIFIED_DOCUMENTS_LIMIT:
+                break
+
+            results = query_unverified_documents(offset=total)
+    except Exception as e:
+        # The status code was already sent, the partial results are closed below and marked as failed
+        logger.exception(f"Error while streaming unverified documents from the vecotrdb after {total} results: {e}")
+        error = f"Error while streaming unverified documents from the vecotrdb after {total} results: {e}"
+
+    if error is None:
+        yield b'],"total":' + orjson.dumps(total) + b'},"message":' + orjson.dumps(f"Queried {total} results from the vecotrdb") + b',"meta":{}}'
+    else:
+        yield b'],"total":' + orjson.dumps(total) + b'},"message":' + orjson.dumps(error) + b',"meta":{"error":true,"partial":true}}'
+
+# Endpoint for loading the image of a dog, the list and search endpoints don't return the images
+@router.get("/get_image/{dogId}", response_model=APIResponse)
+async def get_image(dogId: int, dogImageId: Optional[int] = None):
+    try:
+        # Query the image of the dog, or the given image of the dog, from the vectordb
+        predicates = [Predicate(["dogId"], "Equal", dogId, FilterValueTypes.valueNumber)]
+        if dogImageId is not None:
+            predicates.append(Predicate(["dogImageId"], "Equal", dogImageId, FilterValueTypes.valueNumber))
+
+        results = await asyncio.to_thread(vecotrDBClient.query, class_name="Dog", query_embedding=None, limit=1, filter=and_(*predicates).to_dict(), properties=IMAGE_RETURN_PROPERTIES)
+
+        if len(results) == 0:
+            api_response = APIResponse(status_code=404, message=f"Image of dog with id {dogId} was not found in the vecotrdb", data={ "results": None })
+        else:
+            api_response = APIResponse(status_code=200, message=f"Queried image of dog with id {dogId} from the vecotrdb", data={ "results": results[0] })
+    except Exception as e:
+        logger.exception(f"Error while querying the vecotrdb: {e}")
+        api_response = APIResponse(status_code=500, message=f"Error while querying the vecotrdb: {e}", data={ "results": None })
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
-    
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+
 # Endpoint for quering the database without the need for a query image, only DOG_ID_FIELD
 @router.get("/get_dog_by_id", response_model=APIResponse)
 async def get_dog_by_id(dogId: int):
     try:
         # Query the database
-        dog = dogWithImagesRepository.get_dog_with_images_by_id(dogId)
+        dog = await asyncio.to_thread(dogWithImagesRepository.get_dog_with_images_by_id, dogId)
         
-        dogResponse = mapper.to(DogResponse).map(dog, fields_mapping={"images": []})
-        dogResponse.images = [mapper.to(DogImageResponse).map(image) for image in dog.images]
+        dogResponse = DOG_TO_RESPONSE(dog)
 
-        api_response = APIResponse(status_code=200, message=f"Queried dog from the database", data={ "results": dogResponse.model_dump() })
+        api_response = APIResponse(status_code=200, message=f"Queried dog from the database", data={ "results": dogResponse })
     except Exception as e:
         logger.exception(f"Error while querying the database: {e}")
         api_response = APIResponse(status_code=500, message=f"Error while querying the database: {e}", data={ "total": 0, "results": [] })
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return api_json_response(api_response)
 
 @router.get("/get_dog_by_id_full_details", response_model=APIResponse)
 async def query_by_dog_id(dogId: int, auth_result: dict = Security(auth.verify, scopes=['read:get_dog_by_id_full_details'])):
     try:
         # Query the database
-        dog = dogWithImagesRepository.get_dog_with_images_by_id(dogId)
+        dog = await asyncio.to_thread(dogWithImagesRepository.get_dog_with_images_by_id, dogId)
         
-        dogFullDetailsResponse = mapper.to(DogFullDetailsResponse).map(dog, fields_mapping={"images": []})
-        dogFullDetailsResponse.images = [mapper.to(DogImageResponse).map(image) for image in dog.images]
+        dogFullDetailsResponse = DOG_TO_FULL_DETAILS_RESPONSE(dog)
 
-        api_response = APIResponse(status_code=200, message=f"Queried dog from the database", data={ "results": dogFullDetailsResponse.model_dump() })
+        api_response = APIResponse(status_code=200, message=f"Queried dog from the database", data={ "results": dogFullDetailsResponse })
     except Exception as e:
         logger.exception(f"Error while querying the database: {e}")
         api_response = APIResponse(status_code=500, message=f"Error while querying the database: {e}", data={ "total": 0, "results": [] })
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return api_json_response(api_response)
 
 # Create endpoint for adding possible dog match, using the dogId and possibleMatchId
 @router.post("/add_possible_dog_match", response_model=APIResponse)
@@ -327,10 +476,10 @@ async def add_possible_dog_match(possibleDogMatchRequest: PossibleDogMatchReques
         logger.info(f"Adding possible dog match to the database {possibleDogMatchRequest}")
 
         # Create PossibleDogMatchDTO
-        possibleDogMatchDTO = mapper.to(PossibleDogMatchDTO).map(possibleDogMatchRequest)
+        possibleDogMatchDTO = POSSIBLE_DOG_MATCH_REQUEST_TO_DTO(possibleDogMatchRequest)
 
         # Add the possible dog match to the database
-        dogWithImagesService.add_possible_dog_match(possibleDogMatchDTO)
+        await asyncio.to_thread(dogWithImagesService.add_possible_dog_match, possibleDogMatchDTO)
 
         api_response = APIResponse(status_code=200, message=f"Added possible dog match to the database")
     except Exception as e:
@@ -338,7 +487,7 @@ async def add_possible_dog_match(possibleDogMatchRequest: PossibleDogMatchReques
         api_response = APIResponse(status_code=500, message=f"Error while adding possible dog match to the database: {e}")
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
 # add endpoint for getting dogs reported by a specific user, get the reporterId from the auto0 token
 @router.get("/get_dogs_by_reporter_id", response_model=APIResponse)
@@ -346,11 +495,9 @@ async def get_dogs_by_reporter_id(page: int = Query(1, ge=1), page_size: int = Q
     try:
         logger.info(f"Getting dogs by reporter ID {auth_result['sub']}")
 
-        dogs, total_count = dogWithImagesService.get_all_dogs_with_images_by_reporter_id(auth_result["sub"], page=page, page_size=page_size)
+        dogs, total_count = await asyncio.to_thread(dogWithImagesService.get_all_dogs_with_images_by_reporter_id, auth_result["sub"], page=page, page_size=page_size)
         
-        dogFullDetailsResponses = [mapper.to(DogFullDetailsResponse).map(dog, fields_mapping={"images": []}) for dog in dogs]
-        for dog, dogResponse in zip(dogs, dogFullDetailsResponses):
-            dogResponse.images = [mapper.to(DogImageResponse).map(image) for image in dog.images]
+        dogFullDetailsResponses = [DOG_TO_FULL_DETAILS_RESPONSE(dog) for dog in dogs]
 
         api_response = APIResponse(status_code=200, message=f"Queried dogs by reporter ID from the database", data={ "results": dogFullDetailsResponses, "pagination": { "total": total_count, "page": page, "page_size": page_size, "returned": len(dogFullDetailsResponses) } })
     except Exception as e:
@@ -358,14 +505,14 @@ async def get_dogs_by_reporter_id(page: int = Query(1, ge=1), page_size: int = Q
         api_response = APIResponse(status_code=500, message=f"Error while querying dogs by reporter ID from the database: {e}", data={ "total": 0, "results": [] })
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=jsonable_encoder(api_response), status_code=api_response.status_code)
+        return api_json_response(api_response)
 
 @router.get("/get_possible_dog_matches_count", response_model=int)
 async def get_possible_dog_matches_count():
     try:
         logger.info(f"Getting total possible dog matches count")
 
-        total_count = dogWithImagesService.get_possible_dog_matches_count()
+        total_count = await asyncio.to_thread(dogWithImagesService.get_possible_dog_matches_count)
 
         api_response = total_count
     except Exception as e:
@@ -373,7 +520,7 @@ async def get_possible_dog_matches_count():
         api_response = 0
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response, status_code=200)    
+        return ORJSONResponse(content=api_response, status_code=200)    
 
 @router.get("/get_possible_dog_matches", response_model=APIResponse)
 async def get_possible_dog_matches(dogId: Optional[int] = None, page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100), auth_result: dict = Security(auth.verify, scopes=['read:get_possible_dog_matches'])):
@@ -381,14 +528,9 @@ async def get_possible_dog_matches(dogId: Optional[int] = None, page: int = Quer
     try:
         logger.info(f"Getting possible dog matches for dog with id {dogId}")
 
-        possibleDogMatches, total_count = dogWithImagesService.get_possible_dog_matches(dog_id=dogId, page=page, page_size=page_size)
+        possibleDogMatches, total_count = await asyncio.to_thread(dogWithImagesService.get_possible_dog_matches, dog_id=dogId, page=page, page_size=page_size)
 
-        possibleDogMatchResponses = [mapper.to(PossibleDogMatchResponse).map(possibleDogMatch, fields_mapping={ "dog": None, "possibleMatch": None }) for possibleDogMatch in possibleDogMatches]
-        for possibleDogMatch, possibleDogMatchResponse in zip(possibleDogMatches, possibleDogMatchResponses):
-            possibleDogMatchResponse.dog = mapper.to(DogResponse).map(possibleDogMatch.dog, fields_mapping={ "images": [] })
-            possibleDogMatchResponse.dog.images = [mapper.to(DogImageResponse).map(image) for image in possibleDogMatch.dog.images]
-            possibleDogMatchResponse.possibleMatch = mapper.to(DogResponse).map(possibleDogMatch.possibleMatch, fields_mapping={ "images": [] })
-            possibleDogMatchResponse.possibleMatch.images = [mapper.to(DogImageResponse).map(image) for image in possibleDogMatch.possibleMatch.images]
+        possibleDogMatchResponses = [POSSIBLE_DOG_MATCH_TO_RESPONSE(possibleDogMatch) for possibleDogMatch in possibleDogMatches]
 
         api_response = APIResponse(status_code=200, message=f"Queried possible dog matches from the database", data={ "results": possibleDogMatchResponses, "pagination": { "total": total_count, "page": page, "page_size": page_size, "returned": len(possibleDogMatchResponses) } })
     except Exception as e:
@@ -396,7 +538,7 @@ async def get_possible_dog_matches(dogId: Optional[int] = None, page: int = Quer
         api_response = APIResponse(status_code=500, message=f"Error while querying possible dog matches from the database: {e}", data={ "total": 0, "results": [] })
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=jsonable_encoder(api_response), status_code=api_response.status_code)
+        return api_json_response(api_response)
 
 @router.post("/add_document", response_model=APIResponse)
 async def add_document(dogRequest: DogAddRequest, auth_result: dict = Security(auth.verify)):
@@ -405,24 +547,29 @@ async def add_document(dogRequest: DogAddRequest, auth_result: dict = Security(a
     try:
         # Handle the image, resize it and convert it to base64 with webp format and get the content type
         # Unzip the array of tuples coming back from handle_uploaded_images
-        base64Images = handle_uploaded_images(dogRequest.base64Images)
+        base64Images = await handle_uploaded_images(dogRequest.base64Images)
 
         # Create DogDocument
-        # Map the DogRequest to DogDTO
-        dogDTO = mapper.to(DogDTO).map(dogRequest, fields_mapping={
-            "images": [], "reporterId": auth_result["sub"], "isVerified": IS_VERIFIED_FIELD_DEFAULT_VALUE
-        })
-        dogDTO.images = [DogImageDTO(base64Image=base64Image[0], imageContentType=base64Image[1]) for base64Image in base64Images]
-
-        dogDTO, result = dogWithImagesService.add_dog_with_images(dogDTO)
-
-        api_response = APIResponse(status_code=200, message=f"Added documents to the vecotrdb", data=dogDTO.model_dump(), meta=result)
+        # Map the DogRequest to DogDTO, the request was already validated by FastAPI so the DTOs are constructed without revalidation
+        dogDTO = DogDTO.model_construct(
+            **{field: getattr(dogRequest, field) for field in DOG_ADD_REQUEST_TO_DTO_FIELDS},
+            images=[DogImageDTO.model_construct(base64Image=base64Image[0], imageContentType=base64Image[1]) for base64Image in base64Images],
+            reporterId=auth_result["sub"],
+            isVerified=IS_VERIFIED_FIELD_DEFAULT_VALUE
+        )
+
+        dogDTO, result = await asyncio.to_thread(dogWithImagesService.add_dog_with_images, dogDTO)
+
+        api_response = APIResponse(status_code=200, message=f"Added documents to the vecotrdb", data=dogDTO, meta=result)
+    except UploadTooLargeException as e:
+        logger.warning(f"Rejected document image: {e.detail}")
+        api_response = APIResponse(status_code=e.status_code, message=e.detail)
     except Exception as e:
         logger.exception(f"Error while adding documents to the vecotrdb: {e}")
         api_response = APIResponse(status_code=500, message=f"Error while adding documents to the vecotrdb: {e}")
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return api_json_response(api_response)
 
 # Add an endpoint to set isVerified to True
 @router.post("/verify_document", response_model=APIResponse)
@@ -430,11 +577,8 @@ async def verify_document(dogId: int, auth_result: str = Security(auth.verify, s
     logger.info(f"Verify document: {dogId}")
 
     try:
-        # Add the documents to the database
-        logger.info(f"Verify document")
-        result = vecotrDBClient.update_document("Dog", dogId, {
-            "isVerified": True,
-        })
+        # Set isVerified in the database and the vectordb, dogs that are already verified are not rewritten
+        result = await asyncio.to_thread(dogWithImagesService.update_dog_is_verified, dogId, True)
 
         api_response = APIResponse(status_code=200, message=f"Verified document in the vecotrdb", data=result)
     except Exception as e:
@@ -442,18 +586,18 @@ async def verify_document(dogId: int, auth_result: str = Security(auth.verify, s
         api_response = APIResponse(status_code=500, message=f"Error while verifying document in the vecotrdb: {e}")
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
 @router.get("/get_schema")
 async def get_schema(class_name: str):
-    return vecotrDBClient.get_schema(class_name)
+    return await asyncio.to_thread(vecotrDBClient.get_schema, class_name)
 
 # reindex all dogs with images
 @router.get("/reindex_all_dogs_with_images", response_model=APIResponse)
 async def reindex_all_dogs_with_images(auth_result: str = Security(auth.verify, scopes=['write:reindex_all_dogs_with_images'])):
     try:
-        # Reindex all dogs with images
-        result = dogWithImagesService.index_all_dogs_with_images()
+        # Reindex all dogs with images, embedding all the images is run off the event loop
+        result = await asyncio.to_thread(dogWithImagesService.index_all_dogs_with_images)
 
         logger.info(f"Reindexed all dogs with images in the vecotrdb {result}")
         api_response = APIResponse(status_code=200, message=f"Reindexed all dogs with images in the vecotrdb", meta=result)
@@ -462,20 +606,24 @@ async def reindex_all_dogs_with_images(auth_result: str = Security(auth.verify,
         api_response = APIResponse(status_code=500, message=f"Error while reindexing all dogs with images in the vecotrdb: {e}")
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
 
 @router.delete("/clean_all", response_model=APIResponse)
-async def clean_all(recreate_db: bool = False, auth_result: str = Security(auth.verify, scopes=['delete:clean_all'])):
+async def clean_all(recreate_db: bool = False, recreate_schema: bool = False, auth_result: str = Security(auth.verify, scopes=['delete:clean_all'])):
     try:
-        logger.info(f"Deleting all documents from the vectordb. recreate_db: {recreate_db}")
+        logger.info(f"Deleting all documents from the vectordb. recreate_db: {recreate_db}, recreate_schema: {recreate_schema}")
 
-        # Delete all objects from the database
-        vecotrDBClient.clean_all("Dog", dog_class_definition)
+        if recreate_schema:
+            # Delete the class with all its objects and create it again
+            await asyncio.to_thread(vecotrDBClient.clean_all, "Dog", dog_class_definition)
+        else:
+            # Delete all objects from the database, the schema and the vector index are kept
+            await asyncio.to_thread(vecotrDBClient.delete_all, "Dog", "dogId")
 
         # Recreate the database
         if recreate_db:
-            db.recreate_database()
+            await asyncio.to_thread(db.recreate_database)
             message = "All documents were deleted from the vectordb and the database was recreated"
         else:
             message = "All documents were deleted from the vectordb"
@@ -493,7 +641,7 @@ async def clean_all(recreate_db: bool = False, auth_result: str = Security(auth.
         api_response = APIResponse(status_code=500, message=message)
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
 # Add an endpoint to delete dog with images by id
 @router.delete("/delete_dog_by_id", response_model=APIResponse)
@@ -502,7 +650,7 @@ async def delete_dog_by_id(dogId: int, auth_result: str = Security(auth.verify,
 
     try:
         # Delete the dog from the database
-        dogWithImagesService.delete_dog_with_images_by_id(dogId)
+        await asyncio.to_thread(dogWithImagesService.delete_dog_with_images_by_id, dogId)
 
         api_response = APIResponse(status_code=200, message=f"Deleted dog with id {dogId} from the database")
     except Exception as e:
@@ -510,162 +658,133 @@ async def delete_dog_by_id(dogId: int, auth_result: str = Security(auth.verify,
         api_response = APIResponse(status_code=500, message=f"Error while deleting dog with id {dogId} from the database: {e}")
     finally:
         # return back a json response and set the status code to api_response.status_code
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
 @router.get("/dogs", response_model=APIResponse)
 def get_dogs(type: Optional[DogType] = None, page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100)):
     results, total_count = dogWithImagesService.get_all_dogs_with_images(type=type, page=page, page_size=page_size)
 
-    parsed_results = [
-        mapper.to(DogFullDetailsResponse).map(dog, fields_mapping={
-            "images": []
-            })
-        for dog in results
-    ]
-    
-    for dog, dogResponse in zip(results, parsed_results):
-        dogResponse.images = [mapper.to(DogImageResponse).map(image) for image in dog.images]
+    parsed_results = [DOG_TO_FULL_DETAILS_RESPONSE(dog) for dog in results]
     
     api_response = APIResponse(status_code=HTTPStatus.OK.value, data={ "results": parsed_results, "pagination": { "total": total_count, "page": page, "page_size": page_size, "returned": len(parsed_results) } })
     
-    return JSONResponse(content=jsonable_encoder(api_response), status_code=api_response.status_code)
+    return api_json_response(api_response)
 
 @router.get("/get_all_dogs", response_model=APIResponse)
 def get_all_dogs(page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100), auth_result: str = Security(auth.verify, scopes=['read:dogs'])):
     results, total_count = dogWithImagesService.get_all_dogs_with_images(type=None, page=page, page_size=page_size)
 
-    parsed_results = [
-        mapper.to(DogFullDetailsResponse).map(dog, fields_mapping={
-            "images": []
-            })
-        for dog in results
-    ]
-    
-    for dog, dogResponse in zip(results, parsed_results):
-        dogResponse.images = [mapper.to(DogImageResponse).map(image) for image in dog.images]
+    parsed_results = [DOG_TO_FULL_DETAILS_RESPONSE(dog) for dog in results]
     
     api_response = APIResponse(status_code=HTTPStatus.OK.value, data={ "results": parsed_results, "pagination": { "total": total_count, "page": page, "page_size": page_size, "returned": len(parsed_results) } })
     
-    return JSONResponse(content=jsonable_encoder(api_response), status_code=api_response.status_code)
+    return api_json_response(api_response)
 
 @router.get("/get_all_dogs", response_model=APIResponse)
 def get_all_dogs(page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100), auth_result: str = Security(auth.verify, scopes=['read:dogs'])):
     results, total_count = dogWithImagesService.get_all_dogs_with_images(type=None, page=page, page_size=page_size)
 
-    parsed_results = [
-        mapper.to(DogFullDetailsResponse).map(dog, fields_mapping={
-            "images": []
-            })
-        for dog in results
-    ]
-    
-    for dog, dogResponse in zip(results, parsed_results):
-        dogResponse.images = [mapper.to(DogImageResponse).map(image) for image in dog.images]
+    parsed_results = [DOG_TO_FULL_DETAILS_RESPONSE(dog) for dog in results]
     
     api_response = APIResponse(status_code=HTTPStatus.OK.value, data={ "results": parsed_results, "pagination": { "total": total_count, "page": page, "page_size": page_size, "returned": len(parsed_results) } })
     
-    return JSONResponse(content=jsonable_encoder(api_response), status_code=api_response.status_code)
+    return api_json_response(api_response)
 
 @router.delete("/delete_possible_dog_match", response_model=APIResponse)
 async def delete_possible_dog_match(id: int, auth_result: str = Security(auth.verify, scopes=['delete:delete_possible_dog_match'])):
     try:
         logger.info(f"Deleting possible dog match with id {id}")
 
-        dogWithImagesService.delete_possible_dog_match(id)
+        await asyncio.to_thread(dogWithImagesService.delete_possible_dog_match, id)
 
         api_response = APIResponse(status_code=200, message=f"Deleted possible dog match with id {id}")
     except Exception as e:
         logger.exception(f"Error while deleting possible dog match with id {id}: {e}")
         api_response = APIResponse(status_code=500, message=f"Error while deleting possible dog match with id {id}: {e}")
     finally:
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
 @router.post("/dog_resolved", response_model=APIResponse)
 async def dog_resolved(dogResolvedRequest: DogResolvedRequest, auth_result: str = Security(auth.verify, scopes=['write:dog_resolved'])):
     try:
         logger.info(f"Marking dogs ids {dogResolvedRequest.dogId}, {dogResolvedRequest.possibleMatchId} as resolved")
 
-        dogWithImagesService.update_dog_is_resolved(dogResolvedRequest.dogId, dogResolvedRequest.possibleMatchId, True)
+        await asyncio.to_thread(dogWithImagesService.update_dog_is_resolved, dogResolvedRequest.dogId, dogResolvedRequest.possibleMatchId, True)
 
         api_response = APIResponse(status_code=200, message=f"Dogs ids {dogResolvedRequest.dogId}, {dogResolvedRequest.possibleMatchId} marked as resolved")
     except Exception as e:
         logger.exception(f"Error while marking dogs ids {dogResolvedRequest.dogId}, {dogResolvedRequest.possibleMatchId} as resolved: {e}")
         api_response = APIResponse(status_code=500, message=f"Error while marking dogs ids {dogResolvedRequest.dogId}, {dogResolvedRequest.possibleMatchId} as resolved: {e}")
     finally:
-        return JSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
-
-# build a predicate for the properties, breed, type, if they are not None with and_ between them
-@timeit
-def build_filter(dogSearchRequest: DogSearchRequest) -> Optional[Filter]:
-    logger.info(f"Building the filter for queryRequest: {dogSearchRequest}")
+        return ORJSONResponse(content=api_response.to_dict(), status_code=api_response.status_code)
 
-    # create a list of predicates
-    predicates = []
+# Unverified documents are queried and streamed in pages of UNVERIFIED_DOCUMENTS_PAGE_SIZE, up to UNVERIFIED_DOCUMENTS_LIMIT documents
+UNVERIFIED_DOCUMENTS_PAGE_SIZE = 100
+UNVERIFIED_DOCUMENTS_LIMIT = 10000
+UNVERIFIED_DOCUMENTS_FILTER = and_(Predicate(["isVerified"], "Equal", False, FilterValueTypes.valueBoolean)).to_dict()
 
-    # add type predicate
-    if dogSearchRequest.type is not None:
-        predicates.append(Predicate(["type"], "Equal", dogSearchRequest.type.value, FilterValueTypes.valueText))
+# Search request fields that are filtered by equality, in the order the predicates are built after the type
+FILTER_TEXT_FIELDS = ("breed", "sex", "ageGroup", "size", "color", "chipNumber", "name", "location")
 
-    # add breed predicate
-    if dogSearchRequest.breed is not None:
-        predicates.append(Predicate(["breed"], "Equal", dogSearchRequest.breed, FilterValueTypes.valueText))
+# The search endpoints always filter by type, its operand is precomputed with the value for every dog type
+FILTER_TYPE_OPERANDS = { dogType: Predicate(["type"], "Equal", dogType.value, FilterValueTypes.valueText).to_dict() for dogType in DogType }
 
-    # add sex predicate
-    if dogSearchRequest.sex is not None:
-        predicates.append(Predicate(["sex"], "Equal", dogSearchRequest.sex.value, FilterValueTypes.valueText))
+# Where filter operands precomputed from the predicates, per field only the value changes between requests
+FILTER_TEXT_FIELD_OPERANDS = tuple((field, Predicate([field], "Equal", None, FilterValueTypes.valueText).to_dict()) for field in FILTER_TEXT_FIELDS)
 
-    # add ageGroup predicate
-    if dogSearchRequest.ageGroup is not None:
-        predicates.append(Predicate(["ageGroup"], "Equal", dogSearchRequest.ageGroup.value, FilterValueTypes.valueText))
+# Key of the value in the text operands
+FILTER_TEXT_VALUE_KEY = FilterValueTypes.valueText.value
 
-    # add size predicate
-    if dogSearchRequest.size is not None:
-        predicates.append(Predicate(["size"], "Equal", dogSearchRequest.size.value, FilterValueTypes.valueText))
+# isResolved operand, we only want to return dogs that are not resolved
+IS_RESOLVED_FALSE_OPERAND = Predicate(["isResolved"], "Equal", False, FilterValueTypes.valueBoolean).to_dict()
 
-    # add color predicate
-    if dogSearchRequest.color is not None:
-        predicates.append(Predicate(["color"], "Equal", dogSearchRequest.color.value, FilterValueTypes.valueText))
+# isVerified predicate
+# Not added to the filter because we want to return verified and unverified dogs for now until we have a way to verify them
 
-    # add chipNumber predicate
-    if dogSearchRequest.chipNumber is not None:
-        predicates.append(Predicate(["chipNumber"], "Equal", dogSearchRequest.chipNumber, FilterValueTypes.valueText))
+def _filter_value(value: Any) -> Any:
+    # Enum fields are filtered by their value
+    return value.value if isinstance(value, Enum) else value
 
-    # add name predicate
-    if dogSearchRequest.name is not None:
-        predicates.append(Predicate(["name"], "Equal", dogSearchRequest.name, FilterValueTypes.valueText))
+# build the where filter for the properties, breed, type, if they are not None with And between them
+def build_filter(dogSearchRequest: DogSearchRequest) -> Dict[str, Any]:
+    # The type operand is shared, it's never modified
+    operands = [FILTER_TYPE_OPERANDS[dogSearchRequest.type]] if dogSearchRequest.type is not None else []
 
-    # add location predicate
-    if dogSearchRequest.location is not None:
-        predicates.append(Predicate(["location"], "Equal", dogSearchRequest.location, FilterValueTypes.valueText))
+    for field, field_operand in FILTER_TEXT_FIELD_OPERANDS:
+        value = getattr(dogSearchRequest, field)
+        if value is not None:
+            # Copy the precomputed operand of the field and set the value
+            operand = field_operand.copy()
+            operand[FILTER_TEXT_VALUE_KEY] = _filter_value(value)
+            operands.append(operand)
 
-    # add isVerified predicate
-    # Commented out because we want to return verified and unverified dogs for now until we have a way to verify them
-    # if queryRequest.isVerified is not None:
-    #     predicates.append(Predicate(["isVerified"], "Equal", queryRequest.isVerified, FilterValueTypes.valueBoolean))
+    # The isResolved operand is shared, it's never modified
+    operands.append(IS_RESOLVED_FALSE_OPERAND)
 
-    # add isResolved predicate, we only want to return dogs that are not resolved
-    predicates.append(Predicate(["isResolved"], "Equal", False, FilterValueTypes.valueBoolean))
+    return { "operator": "And", "operands": operands }
 
-    # if there are predicates return and_ between them
-    if (len(predicates) > 0):
-        return and_(*predicates)
+def query_vector_db(dogSearchRequest: DogSearchRequest, query_image_content: Optional[bytes] = None, query_image_hash: Optional[str] = None):
+    from app.helpers.model_helper import embed_query_cached
 
-    # if there are no predicates return None
-    return None
+    # Embed the query image, the PIL image is only created if the embedding is not cached yet.
+    # It's opened from the raw image bytes when they are given, without decoding the base64 image again.
+    # The hash of the uploaded image is reused when given, it was computed once before the image was resized
+    if query_image_hash is None:
+        query_image_hash = hash_image(query_image_content if query_image_content is not None else pybase64.b64decode(dogSearchRequest.base64Image))
 
-def query_vector_db(dogSearchRequest: DogSearchRequest):
-    # Open the image from the base64 string to PIL Image
-    query_image = create_pil_images([dogSearchRequest.base64Image])[0]
-
-    # Embed the query image
-    query_embedding = embed_query(query_image=query_image, embedding_model=embedding_model, image_segmentation_model=image_segmentation_model)
+    query_embedding = embed_query_cached(
+        query_image_hash=query_image_hash,
+        create_query_image=lambda: create_pil_image(query_image_content) if query_image_content is not None else create_pil_images([dogSearchRequest.base64Image])[0],
+        embedding_model=embedding_model,
+        image_segmentation_model=image_segmentation_model
+    )
 
     # Build the filter with conditions to query the vector db
     filter = build_filter(dogSearchRequest)
 
     # Query the database
     logger.info(f"Querying the database")
-    results = vecotrDBClient.query(class_name="Dog", query_embedding=query_embedding, limit=dogSearchRequest.top, offset=None, filter=filter.to_dict(), certainty=CERTAINTY, properties=dogSearchRequest.return_properties)
+    results = vecotrDBClient.query(class_name="Dog", query_embedding=query_embedding, limit=dogSearchRequest.top, offset=None, filter=filter, certainty=CERTAINTY, properties=dogSearchRequest.return_properties)
 
 
     # results may contain the same dog id multiple times, so we need to remove the duplicates and keep the one with the highest score
@@ -682,33 +801,54 @@ def query_vector_db(dogSearchRequest: DogSearchRequest):
     # return the unique results
     return unique_results
 
-def handle_uploaded_images(imgs):
+def api_json_response(api_response: APIResponse) -> Response:
     """
-    This function takes a list of uploaded images and returns a list of resized and converted images in base64 format and their content types.
+    Serialize an APIResponse whose data contains pydantic models into a JSON response.
+    """
+    return Response(content=API_RESPONSE_ADAPTER.dump_json(api_response), media_type="application/json", status_code=api_response.status_code)
+
+async def handle_uploaded_image(img):
+    """
+    This function takes an uploaded image and returns it resized and converted in base64 format and its content type.
+    The upload is read asynchronously and the CPU-bound resize and conversion runs on the image thread pool.
 
     Args:
-        imgs: A list of uploaded images.
+        img: An uploaded image, either an UploadFile or a base64 string.
 
     Returns:
-        A list of tuples containing the resized and converted images in base64 format and their content types.
+        A tuple containing the resized and converted image in base64 format, its content type, the resized and converted image bytes
+        and the content hash of the uploaded image.
     """
-    images = []
-    for img in imgs:
-        # Check if file is an UploadFile image or base64 image
-        if isinstance(img, UploadFile):
-            # Read the image content from the uploaded file
-            img_content = img.file.read()
-
-            # Convert the image content to base64 format
-            img_base64 = get_base64(img_content)
-        else:
-            img_base64 = img
-
-        # Resize the image and convert it to the desired format
-        img_base64, img_content_type = resize_and_convert(img_base64, (1024, 1024))
+    # Check if file is an UploadFile image or base64 image
+    if isinstance(img, UploadFile):
+        # Reject the upload by its size before reading it, the size is unknown for chunked uploads
+        if img.size is not None and img.size > MAX_UPLOAD_BYTES:
+            raise UploadTooLargeException(f"Uploaded image size {img.size} bytes exceeds the maximum of {MAX_UPLOAD_BYTES} bytes")
+
+        # Read the image content from the uploaded file without blocking the event loop,
+        # at most one byte over the limit is read to detect too large uploads
+        img = await img.read(MAX_UPLOAD_BYTES + 1)
+        if len(img) > MAX_UPLOAD_BYTES:
+            raise UploadTooLargeException(f"Uploaded image exceeds the maximum size of {MAX_UPLOAD_BYTES} bytes")
+    # Every 4 base64 characters decode to 3 bytes, reject too large images before decoding them
+    elif len(img) // 4 * 3 > MAX_UPLOAD_BYTES:
+        raise UploadTooLargeException(f"Uploaded image size {len(img) // 4 * 3} bytes exceeds the maximum of {MAX_UPLOAD_BYTES} bytes")
+
+    # Decode, resize, convert and encode to base64 the image in a single step on the image thread pool.
+    # The raw bytes are returned as well so callers that need the image itself don't have to decode the base64 again
+    return await asyncio.get_running_loop().run_in_executor(IMG_POOL, process_uploaded_image, img, (1024, 1024))
+
+async def handle_uploaded_images(imgs):
+    """
+    This function takes a list of uploaded images and returns a list of resized and converted images in base64 format and their content types.
+    The images are processed in parallel on the image thread pool, PIL releases the GIL while decoding, resizing and encoding.
 
-        # Append the resized and converted image and its content type to the list
-        images.append((img_base64, img_content_type))
+    Args:
+        imgs: A list of uploaded images.
 
-    # Return the list of resized and converted images and their content types
-    return images
+    Returns:
+        A list of tuples containing the resized and converted images in base64 format, their content types, the resized and converted images bytes
+        and the content hashes of the uploaded images.
+    """
+    # Return the list of resized and converted images and their content types, in the order of the uploaded images
+    return list(await asyncio.gather(*[handle_uploaded_image(img) for img in imgs]))
@@ -102,6 +102,19 @@ class DogWithImagesService:
             logger.exception(f"Error while updating dog isResolved field: {e}")
             raise e
 
+    # Update the dog isVerified field, in the DB and in the vector database
+    def update_dog_is_verified(self, dog_id: int, is_verified: bool) -> dict:
+        try:
+            updated = self.repository.update_dog_is_verified(dog_id, is_verified)
+
+            # The vector database update is guarded as well, so it's also done when a previous attempt failed after the DB update
+            result = self.vectordbIndexer.update_dog_is_verified(dog_id, is_verified)
+
+            return { "db_updated": updated, "vectordb_updated": result["updated"] }
+        except Exception as e:
+            logger.exception(f"Error while updating dog isVerified field: {e}")
+            raise e
+
     def get_possible_dog_matches_count(self) -> int:
         try:
             return self.repository.get_possible_dog_matches_count()
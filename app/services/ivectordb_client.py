@@ -11,6 +11,10 @@ class IVectorDBClient(ABC):
     def clean_all(self, class_name: str) -> None:
         pass
 
+    @abstractmethod
+    def delete_all(self, class_name: str, field_name: str) -> dict:
+        pass
+
     @abstractmethod
     def delete_by_ids(self, class_name: str, field_name: str, ids: list[str]) -> None:
         pass
@@ -27,5 +31,9 @@ class IVectorDBClient(ABC):
     def get_schema(self, class_name: str) -> None:
         pass
 
-    def update_document(self, class_name, dog_id, data:Dict):
+    @abstractmethod
+    def update_vector_index_quantization(self, class_name: str, quantization_config: dict, min_version: tuple = None) -> dict:
+        pass
+
+    def update_document(self, class_name, dog_id, data:Dict, where: Dict[str, Any] = None):
         pass
\ No newline at end of file
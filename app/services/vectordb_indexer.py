@@ -1,14 +1,15 @@
 # Add function that will index all dogs with images
-from datetime import datetime
 from typing import Any, List
 from app.DAL.models import Dog, DogImage
 from app.DTO.dog_dto import DogDTO, DogImageDTO
 # from app.DTO.dog_dto import DogDTO
-from app.helpers.image_helper import create_pil_images
+from app.helpers.image_helper import create_pil_image, hash_image
+from app.helpers.weaviate_helper import FilterValueTypes
+from app.models.predicates import Predicate, and_
 from app.services.ivectordb_client import IVectorDBClient
 from app.MyLogger import logger
-from app.helpers.model_helper import embed_documents, embed_query
-from weaviate.util import generate_uuid5
+import pybase64
+import uuid
 
 class VectorDBIndexer:
     def __init__(self, vecotrDBClient: IVectorDBClient, embedding_model, image_segmentation_model) -> None:
@@ -17,6 +18,9 @@ class VectorDBIndexer:
         self.image_segmentation_model = image_segmentation_model
 
     def index_dogs_with_images(self, dogDTOs: list[DogDTO]) -> None:
+        # Imported here, the model helper pulls in torch and the models which are heavy to import
+        from app.helpers.model_helper import embed_documents_cached
+
         # Add the document to the database
         documents = []
         failed_objects = []
@@ -24,17 +28,25 @@ class VectorDBIndexer:
         # iterate over dogs and each image for each dog and create a list of data_properties, add them to documents. Add the documents to the database
         for dogDTO in dogDTOs:
             try:
-                # Create a list of PIL images from the base64 images
-                pilImages = create_pil_images([image.base64Image for image in dogDTO.images])
+                # Decode the base64 images once, the raw bytes are hashed and opened from
+                imagesContent = [pybase64.b64decode(image.base64Image) for image in dogDTO.images]
+
+                # Embed the document images, only the images that are not in the embedding cache are opened and embedded
+                dog_images_embedding = embed_documents_cached(
+                    document_hashes=[hash_image(imageContent) for imageContent in imagesContent],
+                    create_documents=lambda indexes: [create_pil_image(imagesContent[i]) for i in indexes],
+                    embedding_model=self.embedding_model,
+                    image_segmentation_model=self.image_segmentation_model
+                )
+
+                # The dog properties are the same for all its images, serialize them once
+                dog_properties = dogDTO.to_vectordb_json()
 
-                # Embed the document image
-                dog_images_embedding = embed_documents(pilImages, self.embedding_model, image_segmentation_model=self.image_segmentation_model)
-            
                 for i, dogImage in enumerate(dogDTO.images):
                     try:
                         logger.info(f"Adding document {dogDTO.id} with image id {dogImage.id} to VectorDB")
-                        data_properties = create_data_properties(dogDTO, dogImage)
-                        data_properties["uuid5"] = generate_uuid5({"dogId": dogDTO.id, "imageId": dogImage.id })
+                        data_properties = create_data_properties(dogDTO, dogImage, dog_properties)
+                        data_properties["uuid5"] = dog_image_uuid5(dogDTO.id, dogImage.id)
                         data_properties["document_embedding"] = dog_images_embedding[i]
                         documents.append(data_properties)
                     except Exception as e:
@@ -51,6 +63,20 @@ class VectorDBIndexer:
         
         return result
     
+    def update_dog_is_verified(self, dog_id: int, is_verified: bool) -> dict:
+        # Update only the documents of the dog that don't have the value yet
+        result = self.vecotrDBClient.update_document(
+            class_name='Dog',
+            dog_id=None,
+            data={ "isVerified": is_verified },
+            where=and_(
+                Predicate(["dogId"], "Equal", dog_id, FilterValueTypes.valueNumber),
+                Predicate(["isVerified"], "NotEqual", is_verified, FilterValueTypes.valueBoolean)
+            ).to_dict()
+        )
+
+        return result
+
     def delete_dogs_with_images(self, dogs: List[Dog]) -> None:
         # Delete the documents from the database
 
@@ -62,14 +88,18 @@ class VectorDBIndexer:
 
         return result
 
-def create_data_properties(dog: DogDTO, dogImage: DogImageDTO) -> dict[str, Any]:
-    # Transform document to dictionary
-    data_properties = dog.to_vectordb_json()
-    
-    # Transform datetime objects to string
-    # for key, val in data_properties.items():
-    #     if isinstance(val, datetime):
-    #         data_properties[key.lower()] = val.strftime("%Y-%m-%dT%H:%M:%S.%SZ") if val else None
+def dog_image_uuid5(dog_id: int, image_id: int) -> str:
+    """
+    Generate the deterministic uuid of the document of a dog image.
+    The uuid is the same weaviate's generate_uuid5({"dogId": dog_id, "imageId": image_id}) generates,
+    without building and stringifying the dict, so documents indexed before keep their uuid.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{{'dogId': {dog_id}, 'imageId': {image_id}}}"))
+
+def create_data_properties(dog: DogDTO, dogImage: DogImageDTO, dog_properties: dict[str, Any] = None) -> dict[str, Any]:
+    # Transform document to dictionary, or copy the already transformed dog properties.
+    # The datetime fields are already serialized to strings by model_dump(mode="json")
+    data_properties = dict(dog_properties) if dog_properties is not None else dog.to_vectordb_json()
 
     data_properties["dogId"] = dog.id
     data_properties["dogImageId"] = dogImage.id
@@ -6,15 +6,30 @@ from app.helpers.weaviate_helper import FilterValueTypes
 from app.models.predicates import Predicate, or_
 from app.services.ivectordb_client import IVectorDBClient
 from app.MyLogger import logger
+import os
 import weaviate
+from weaviate.config import Config, ConnectionConfig
+
+WEAVIATE_POOL_CONNECTIONS = int(os.environ.get("WEAVIATE_POOL_CONNECTIONS", 32))
+WEAVIATE_POOL_MAXSIZE = int(os.environ.get("WEAVIATE_POOL_MAXSIZE", 32))
+
+# Batch import settings, the batch size is the initial size of the dynamic batching
+WEAVIATE_BATCH_SIZE = int(os.environ.get("WEAVIATE_BATCH_SIZE", 100))
+WEAVIATE_BATCH_NUM_WORKERS = int(os.environ.get("WEAVIATE_BATCH_NUM_WORKERS", 4))
+
+# Vector index settings that can't be changed once the class is created
+IMMUTABLE_VECTOR_INDEX_CONFIG_KEYS = frozenset(("distance", "efConstruction", "maxConnections"))
 
 class WeaviateVectorDBClient(IVectorDBClient):
     def __init__(self, client: Any = None, url: str = None):        
         if (isinstance(client, weaviate.Client)):
             self.client = client
         else:
-            # Connect to the Weaviate local instance
-            self.client: weaviate.Client = weaviate.Client(url)
+            # Connect to the Weaviate local instance, keeping a pool of keep-alive connections shared by all the requests
+            self.client: weaviate.Client = weaviate.Client(url, additional_config=Config(connection_config=ConnectionConfig(
+                session_pool_connections=WEAVIATE_POOL_CONNECTIONS,
+                session_pool_maxsize=WEAVIATE_POOL_MAXSIZE
+            )))
 
     @timeit
     def add_documents_batch(self, class_name: str, documents: list[dict]) -> None:
@@ -26,10 +41,12 @@ class WeaviateVectorDBClient(IVectorDBClient):
         # Add the documents to the database
 
         #region: Catch batch errors and successes
-        success = []
+        # Only the successes are counted, their properties hold the base64 images and are not needed
+        success_count = 0
         errors = []
 
         def check_batch_result(results: dict):
+            nonlocal success_count
             if results is not None:
                 for result in results:
                     if "result" in result and "errors" in result["result"]:
@@ -38,12 +55,12 @@ class WeaviateVectorDBClient(IVectorDBClient):
                             errors.append({"error": result["result"]["errors"]["error"], "properties": result["properties"]})
                     else:
                         # logger.info(f"found result {result}")
-                        success.append({ "properties": result["properties"] })
+                        success_count += 1
         #endregion
 
         self.client.batch.configure(
-            batch_size=100,  # Specify the batch size
-            num_workers=4,   # Parallelize the process
+            batch_size=WEAVIATE_BATCH_SIZE,  # Specify the batch size
+            num_workers=WEAVIATE_BATCH_NUM_WORKERS,   # Parallelize the process
             dynamic=True,  # By default
             callback=check_batch_result
         )
@@ -64,17 +81,17 @@ class WeaviateVectorDBClient(IVectorDBClient):
                         vector=document_embedding
                     )
                 except Exception as e:
-                    logger.error(f"Error adding document [{data_properties}] {i+1} of {documents_length} to the database: {e}")
+                    logger.error(f"Error adding document {i+1} of {documents_length} with dogId {data_properties.get('dogId')} and dogImageId {data_properties.get('dogImageId')} to the database: {e}")
                     errors.append({"error": [{ "message": f"{e}"}], "properties": data_properties})
                     continue
 
-        logger.info(f"Added {len(success)} documents to the database")
+        logger.info(f"Added {success_count} documents to the database")
 
         if len(errors) > 0:
             logger.error(f"Errors adding documents to the database: {len(errors)}")
-            logger.error(f"Errors: {errors}")
+            logger.error(f"Errors: {[error['error'] for error in errors]}")
 
-        return { "successful": len(success), "failed": len(errors), "failed_objects": errors }
+        return { "successful": success_count, "failed": len(errors), "failed_objects": errors }
 
     @timeit
     def delete_by_ids(self, class_name: str, field_name: str, ids: list[int]) -> None:
@@ -132,6 +149,38 @@ class WeaviateVectorDBClient(IVectorDBClient):
             logger.exception(f"Error deleting all documents of '{class_name}' class from the vectordb: {e}")
             raise
    
+    @timeit
+    def delete_all(self, class_name: str, field_name: str) -> dict:
+        """
+        Deletes all documents of specific class name from the vectordb, keeping the class schema and its vector index.
+        """
+        try:
+            logger.info(f"Deleting all documents of '{class_name}' class from the vectordb, keeping the schema")
+
+            # Every document has a non negative field_name, so this filter matches all the documents
+            filter = Predicate([field_name], "GreaterThanEqual", 0, FilterValueTypes.valueNumber).to_dict()
+
+            # A batch delete is capped by the server's max results, loop until nothing is left to delete
+            total_deleted = 0
+            while True:
+                result = self.client.batch.delete_objects(
+                    class_name=class_name,
+                    where=filter,
+                )
+
+                deleted = result["results"]["successful"]
+                total_deleted += deleted
+
+                if deleted == 0 or result["results"]["matches"] <= deleted:
+                    break
+
+            logger.info(f"Deleted {total_deleted} documents of '{class_name}' class from the vectordb")
+
+            return { "success": True, "deleted": total_deleted }
+        except Exception as e:
+            logger.exception(f"Error deleting all documents of '{class_name}' class from the vectordb: {e}")
+            raise
+
     @timeit
     def query(self, class_name: str, query_embedding: List[float], limit: int = None, offset: int = None, filter: Dict[str, Any] = None, certainty = 0.0, properties: List[str] = None):
         """
@@ -142,15 +191,19 @@ class WeaviateVectorDBClient(IVectorDBClient):
         # Query the database
         logger.info(f"Querying the database")
         if query_embedding is None:
-            results = (
+            query = (
                 self.client.query
                 .get(class_name, properties)
                 .with_where(filter)
                 .with_limit(limit)
                 .with_additional(["id"])
-                # .with_offset(offset)
-                .do()
             )
+
+            # Page through the results when an offset is given
+            if offset is not None:
+                query = query.with_offset(offset)
+
+            results = query.do()
         else:
             results = (
                 self.client.query
@@ -185,7 +238,8 @@ class WeaviateVectorDBClient(IVectorDBClient):
 
         
 
-        logger.info(f"Results: {results}")
+        # Only the number of results is logged, the results hold the base64 images
+        logger.info("Results: %d documents", len(results))
         
         return results
 
@@ -204,6 +258,7 @@ class WeaviateVectorDBClient(IVectorDBClient):
                     logger.info(f"Schema for class '{class_name}' was created in the vectordb")
                 else:
                     logger.info(f"Schema for class '{class_name}' already exists in the vectordb")
+                    self.update_vector_index_config(class_name, class_obj)
             except Exception as e:
                 logger.error(f"Error creating class: {e}")
                 # Delete all objects and class from the vectordb
@@ -218,14 +273,111 @@ class WeaviateVectorDBClient(IVectorDBClient):
             logger.error(f"Error creating schema for class '{class_name}' with schema {class_obj} in the vectordb: {e}")
             return { "success": False, "message": f"Error creating schema for class '{class_name}' with schema {class_obj} in the vectordb: {e}" }
         
+    def update_vector_index_config(self, class_name: str, class_obj: dict) -> bool:
+        """
+        Applies the vector index config of class_obj (e.g. enabling quantization) to an already existing class.
+        Settings that can only be set when the class is created are skipped.
+        Errors are only logged, the existing class and its objects are kept as is.
+        """
+        vector_index_config = { key: value for key, value in class_obj.get("vectorIndexConfig", {}).items() if key not in IMMUTABLE_VECTOR_INDEX_CONFIG_KEYS }
+        if not vector_index_config:
+            return True
+
+        try:
+            logger.info(f"Updating the vector index config of class '{class_name}' to {vector_index_config}")
+            self.client.schema.update_config(class_name, { "vectorIndexConfig": vector_index_config })
+            return True
+        except Exception as e:
+            logger.error(f"Error updating the vector index config of class '{class_name}': {e}")
+            return False
+
+    def get_version(self) -> tuple:
+        """
+        Gets the version of the Weaviate server as a (major, minor, patch) tuple.
+        """
+        version = self.client.get_meta()["version"]
+
+        return tuple(int(part) for part in version.split("-")[0].split("."))
+
+    def update_vector_index_quantization(self, class_name: str, quantization_config: dict, min_version: tuple = None) -> dict:
+        """
+        Enables the quantization of the vector index of an existing class.
+        The quantization is trained on the stored vectors, so it's only enabled when the class holds vectors,
+        and it's rejected when the Weaviate server is older than min_version.
+        Errors are only logged, the class keeps its full precision vectors.
+        """
+        if min_version is not None:
+            try:
+                version = self.get_version()
+            except Exception as e:
+                logger.error(f"Error getting the Weaviate version, the vector index quantization was not enabled: {e}")
+                return { "success": False, "message": f"Error getting the Weaviate version: {e}" }
+
+            if version < min_version:
+                logger.error(f"Weaviate {'.'.join(map(str, version))} doesn't support the vector index quantization {quantization_config}, it requires Weaviate {'.'.join(map(str, min_version))} or later. The vector index keeps full precision vectors")
+                return { "success": False, "message": f"The vector index quantization requires Weaviate {'.'.join(map(str, min_version))} or later" }
+
+        try:
+            results = self.client.query.aggregate(class_name).with_meta_count().do()
+            if results.get("errors"):
+                raise Exception(results["errors"])
+
+            count = results["data"]["Aggregate"][class_name][0]["meta"]["count"]
+        except Exception as e:
+            logger.error(f"Error counting the documents of class '{class_name}', the vector index quantization was not enabled: {e}")
+            return { "success": False, "message": f"Error counting the documents of class '{class_name}': {e}" }
+
+        if count == 0:
+            logger.info(f"Class '{class_name}' holds no vectors yet, the vector index quantization will be enabled on a later startup")
+            return { "success": False, "message": f"Class '{class_name}' holds no vectors yet" }
+
+        if not self.update_vector_index_config(class_name, { "vectorIndexConfig": quantization_config }):
+            return { "success": False, "message": f"Error updating the vector index quantization of class '{class_name}'" }
+
+        return { "success": True, "message": f"Vector index quantization of class '{class_name}' was updated to {quantization_config}" }
+
     @timeit
     def get_schema(self, class_name: str):
         return self.client.schema.get(class_name)
 
     @timeit
-    def update_document(self, class_name, dog_id, data:Dict):
-        self.client.data_object.update(
-            uuid=dog_id,
-            class_name=class_name,
-            data_object=data,
-        )
\ No newline at end of file
+    def update_document(self, class_name, dog_id, data:Dict, where: Dict[str, Any] = None):
+        """
+        Updates the document with the uuid dog_id, or when a where filter is given all the documents matching it.
+        Guarding the update with a where filter on the updated values (e.g. isVerified == False) makes repeated updates
+        free, documents that are already up to date are not rewritten.
+        """
+        if where is None:
+            self.client.data_object.update(
+                uuid=dog_id,
+                class_name=class_name,
+                data_object=data,
+            )
+
+            return { "updated": 1 }
+
+        # Get the ids of the documents matching the filter
+        results = (
+            self.client.query
+            .get(class_name, list(data.keys()))
+            .with_where(where)
+            .with_limit(10000)
+            .with_additional(["id"])
+            .do()
+        )
+
+        if results.get("errors"):
+            logger.error(f"Error while querying the documents to update: {results['errors']}")
+            raise Exception(f"Error while querying the documents to update: {results['errors']}")
+
+        uuids = [doc["_additional"]["id"] for doc in results["data"]["Get"][class_name]]
+        logger.info(f"Updating {len(uuids)} documents of '{class_name}' class matching {where} with {data}")
+
+        for uuid in uuids:
+            self.client.data_object.update(
+                uuid=uuid,
+                class_name=class_name,
+                data_object=data,
+            )
+
+        return { "updated": len(uuids) }
\ No newline at end of file
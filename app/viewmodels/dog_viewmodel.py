@@ -27,6 +27,13 @@ RETURN_PROPERTIES = [
     "dogFoundOn"
 ]
 
+# Properties returned by the list and search endpoints, the image is left out and fetched on demand by
+# its dogId and dogImageId from the get_image endpoint
+LIST_RETURN_PROPERTIES = [property for property in RETURN_PROPERTIES if property != "imageBase64"] + ["dogImageId"]
+
+# Properties returned by the get_image endpoint
+IMAGE_RETURN_PROPERTIES = ["dogId", "dogImageId", "imageBase64", "imageContentType"]
+
 
 # class QueryRequest(BaseModel):
 #     type: DogType
@@ -56,7 +63,7 @@ class DogSearchRequest(BaseModel):
     chipNumber: Optional[str] = None
     location: Optional[str] = None
 
-    return_properties: Optional[List[str]] = RETURN_PROPERTIES
+    return_properties: Optional[List[str]] = LIST_RETURN_PROPERTIES
 
 class DogAddRequest(BaseModel):
     base64Images: List[str]